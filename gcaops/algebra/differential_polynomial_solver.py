@@ -4,12 +4,46 @@ Homogeneous differential polynomial equation solver
 from collections import defaultdict
 from sage.matrix.constructor import matrix
 from sage.modules.free_module_element import vector
+from sage.rings.integer_ring import ZZ
+from sage.rings.rational_field import QQ
 from sage.misc.verbose import verbose
 from .differential_polynomial_ring import DifferentialPolynomial
 
 # TODO: system of equations, e.g. for H
 
-def solve_homogeneous_diffpoly(target, source, unknowns):
+def ansatz_data_for_unknown(v, source_part_v, ansatz_monomials_v, deriv_spec):
+    """
+    Return the list of (monomial, terms) pairs for the admissible ansatz monomials of the unknown ``v``.
+
+    Helper for :func:`solve_homogeneous_diffpoly`.
+
+    In ``source_part_v`` all unknowns other than ``v`` and its derivatives have
+    already been substituted by zero, so the substitution below only has to
+    touch the active variables.
+    """
+    R = v.parent()
+    max_differential_orders = R.max_differential_orders()
+    max_steps = max((len(s) for _, s in deriv_spec), default=0)
+    subs = {}
+    data = []
+    for m in ansatz_monomials_v:
+        # an ansatz monomial is admissible if each of its variables can be
+        # differentiated the required number of times; checking this upfront
+        # avoids exception-driven control flow around total_derivative
+        if max_steps > 0:
+            slacks = [max_differential_orders[idx[0]] - sum(idx[1:])
+                      for x in m._polynomial.variables()
+                      for idx in (R._var_to_idx.get(x),) if idx is not None]
+            if slacks and max_steps > min(slacks):
+                continue
+        subs[v] = m
+        for w, s in deriv_spec:
+            subs[w] = m.total_derivative(*s)
+        f = source_part_v.subs(subs)
+        data.append((m, list(f._polynomial)))
+    return data
+
+def solve_homogeneous_diffpoly(target, source, unknowns, max_workers=1):
     """
     Return a solution of a homogeneous differential polynomial equation.
 
@@ -21,6 +55,8 @@ def solve_homogeneous_diffpoly(target, source, unknowns):
 
     - ``unknowns`` -- a list of fibre variables, such that the total derivatives of those variables appear in ``source``
 
+    - ``max_workers`` -- (default: 1) the number of worker processes to use for the ansatz construction, or ``None`` to use ``os.cpu_count()``
+
     ALGORITHM:
 
     Builds an ansatz based on the homogeneity, and solves the arising linear system.
@@ -30,23 +66,28 @@ def solve_homogeneous_diffpoly(target, source, unknowns):
     if not isinstance(source, DifferentialPolynomial):
         raise ValueError('source must be a differential polynomial')
 
-    target_monomials = set(target.monomials())
     if not target.is_fibre_degree_homogeneous():
         raise ValueError('target must be fibre degree homogeneous')
-    target_degrees = next(iter(target_monomials)).fibre_degrees()
+    target_degrees = target.monomials()[0].fibre_degrees()
     verbose('target degrees: {}'.format(target_degrees), level=1)
 
     if not target.is_weight_homogeneous():
         raise ValueError('target must be weight homogeneous')
-    target_weights = next(iter(target_monomials)).weights()
+    target_weights = target.monomials()[0].weights()
     verbose('target weights: {}'.format(target_weights), level=1)
 
+    # the target basis is collected as monomials of the underlying polynomial
+    # ring, to avoid wrapping every term in a DifferentialPolynomial
+    target_monomials = list(target._polynomial.monomials())
+
     R = target.parent()
     unknowns_derivatives = defaultdict(set)
     all_unknowns = set(unknowns)
+    variable_subscripts = {}
     for v in source.variables():
         if v in R.jet_variables():
             w, s = v.variable_subscript()
+            variable_subscripts[v] = (w, s)
             if w in unknowns:
                 unknowns_derivatives[w].add(v)
                 all_unknowns.add(v)
@@ -63,80 +104,90 @@ def solve_homogeneous_diffpoly(target, source, unknowns):
     ansatz_degrees = defaultdict(set)
     ansatz_weights = defaultdict(set)
     for v in all_unknowns:
-        w, s = v.variable_subscript()
+        w, s = variable_subscripts.get(v, (v, ())) # unknowns themselves have no subscript
+        v_weights = v.weights()
         for m in (source_part[w] // v).monomials():
-            ansatz_degree = target_degrees - m.fibre_degrees() # equation is linear in unknowns
-            ansatz_degree.set_immutable()
+            ansatz_degree = tuple(target_degrees - m.fibre_degrees()) # equation is linear in unknowns
+            ansatz_weight = tuple(target_weights - m.weights() - v_weights)
+            if any(c < 0 for c in ansatz_degree) or any(c < 0 for c in ansatz_weight):
+                continue # no monomials with such degrees or weights exist
             ansatz_degrees[w].add(ansatz_degree)
-            ansatz_weight = target_weights - m.weights() - v.weights()
-            ansatz_weight.set_immutable()
             ansatz_weights[w].add(ansatz_weight)
 
     verbose('ansatz degrees: {}'.format(dict(ansatz_degrees)), level=1)
     verbose('ansatz weights: {}'.format(dict(ansatz_weights)), level=1)
 
     # generate monomials. TODO: optional?
+    max_differential_orders = R.max_differential_orders()
+    homogeneous_monomials_cache = {}
     ansatz_monomials = defaultdict(set)
     for v in unknowns:
         for d in ansatz_degrees[v]:
             for w in ansatz_weights[v]:
-                ansatz_monomials[v].update(R.homogeneous_monomials(d, w, max_differential_orders=R.max_differential_orders()))
+                monomials = homogeneous_monomials_cache.get((d, w))
+                if monomials is None:
+                    monomials = tuple(R.homogeneous_monomials(d, w, max_differential_orders=max_differential_orders))
+                    homogeneous_monomials_cache[(d, w)] = monomials
+                ansatz_monomials[v].update(monomials)
 
     verbose('ansatz #monomials: ' + str({d : len(m) for d,m in ansatz_monomials.items()}), level=1)
     verbose('ansatz monomials: {}'.format(ansatz_monomials), level=2)
 
     # update target monomials by substituting ansatz for fibre variables (and total derivatives)
-    for v in unknowns:
-        pre_subs = dict(zip(all_unknowns, [R.zero()]*len(all_unknowns)))
-        for m in ansatz_monomials[v]:
-            subs = pre_subs.copy()
-            subs[v] = m
-            admissible = True
-            for w in unknowns_derivatives[v]:
-                _, s = w.variable_subscript()
-                try:
-                    subs[w] = m.total_derivative(*s)
-                except ValueError:
-                    admissible = False
-                    break
-            if not admissible:
-                continue
-            f = source_part[v].subs(subs)
-            target_monomials.update(f.monomials())
-
-    target_basis = list(target_monomials)
+    deriv_specs = {v : [(w, variable_subscripts[w][1]) for w in unknowns_derivatives[v]] for v in unknowns}
+    ansatz_data = []
+    if max_workers == 1 or len(unknowns) == 1:
+        per_unknown_data = [(v, ansatz_data_for_unknown(v, source_part[v], ansatz_monomials[v], deriv_specs[v])) for v in unknowns]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [(v, executor.submit(ansatz_data_for_unknown, v, source_part[v], ansatz_monomials[v], deriv_specs[v])) for v in unknowns]
+            per_unknown_data = [(v, future.result()) for v, future in futures]
+    for v, data in per_unknown_data:
+        for m, fc in data:
+            ansatz_data.append((v, m, fc))
+            target_monomials.extend(fm for _, fm in fc)
+
+    target_basis = list(dict.fromkeys(target_monomials)) # dedup, hashing each monomial once
+    basis_index = {m : i for i, m in enumerate(target_basis)}
 
     verbose('len(target_basis) == {}'.format(len(target_basis)), level=1)
     verbose('target basis: {}'.format(target_basis), level=2)
 
-    M = matrix(R.base_ring(), len(target_basis), 0, sparse=True)
     ansatz_basis = []
-    for v in unknowns:
-        pre_subs = dict(zip(all_unknowns, [R.zero()]*len(all_unknowns)))
-        for m in ansatz_monomials[v]:
-            subs = pre_subs.copy()
-            subs[v] = m
-            admissible = True
-            for w in unknowns_derivatives[v]:
-                _, s = w.variable_subscript()
-                try:
-                    subs[w] = m.total_derivative(*s)
-                except ValueError:
-                    admissible = False
-                    break
-            if not admissible:
-                continue
-            ansatz_basis.append((v, m))
-            f = source_part[v].subs(subs)
-            V = vector(R.base_ring(), len(target_basis), {target_basis.index(m) : c for c,m in f}, sparse=True)
-            M = M.augment(V)
+    entries = {}
+    for v, m, fc in ansatz_data:
+        col = len(ansatz_basis)
+        ansatz_basis.append((v, m))
+        for c, fm in fc:
+            entries[(basis_index[fm], col)] = c
 
     verbose('len(ansatz_basis) == {}'.format(len(ansatz_basis)), level=1)
     verbose('ansatz basis: {}'.format(ansatz_basis), level=2)
 
-    target_vector = vector(R.base_ring(), len(target_basis), {target_basis.index(m) : c for c,m in target}, sparse=True)
-
-    solution_vector = M.solve_right(target_vector)
+    target_entries = {basis_index[m] : c for c,m in target._polynomial}
+
+    # prune rows without any ansatz contribution; they can only be matched by zero
+    used_rows = set(i for i, _ in entries)
+    nrows = len(target_basis)
+    if len(used_rows) < nrows:
+        if not set(target_entries).issubset(used_rows):
+            raise ValueError('matrix equation has no solutions')
+        row_map = {i : k for k, i in enumerate(sorted(used_rows))}
+        entries = {(row_map[i], j) : c for (i, j), c in entries.items()}
+        target_entries = {row_map[i] : c for i, c in target_entries.items()}
+        nrows = len(used_rows)
+        verbose('pruned {} empty rows'.format(len(target_basis) - nrows), level=1)
+
+    M = matrix(R.base_ring(), nrows, len(ansatz_basis), entries, sparse=True)
+    target_vector = vector(R.base_ring(), nrows, target_entries, sparse=True)
+
+    if R.base_ring() in (ZZ, QQ):
+        # Sage's dense integer/rational solvers (FLINT/IML) are much faster
+        # than generic sparse echelonization.
+        solution_vector = M.dense_matrix().solve_right(target_vector)
+    else:
+        solution_vector = M.solve_right(target_vector)
     solution = {v : R.zero() for v in unknowns}
     for i in range(len(ansatz_basis)):
         v, b = ansatz_basis[i]
@@ -2,9 +2,9 @@ r"""
 Polydifferential operator
 """
 from collections.abc import Iterable, MutableMapping
-from itertools import product, combinations, permutations
-from functools import reduce, partial
-from operator import mul
+from itertools import product, permutations
+from functools import lru_cache, partial
+from math import comb, factorial, prod
 from collections import defaultdict
 from sage.structure.unique_representation import UniqueRepresentation
 from sage.structure.parent import Parent
@@ -12,12 +12,29 @@ from sage.structure.element import AlgebraElement
 from sage.structure.richcmp import op_EQ, op_NE
 from sage.categories.algebras import Algebras
 
+def _compositions_iter(num, width):
+    if width == 1:
+        yield (num,)
+        return
+    for first in range(num + 1):
+        for rest in _compositions_iter(num - first, width - 1):
+            yield (first,) + rest
+
+@lru_cache(maxsize=None)
 def compositions(num, width):
-    m = num + width - 1
-    last = (m,)
-    first = (-1,)
-    for t in combinations(range(m), width - 1):
-        yield [v - u - 1 for u, v in zip(first + t, t + last)]
+    return tuple(_compositions_iter(num, width))
+
+def _normalize_multi_indices(multi_indices):
+    """
+    Return ``multi_indices`` as a tuple of ``bytes`` multi-indices.
+
+    Multi-indices are stored as ``bytes`` internally because they hash and
+    compare faster than tuples of ints; tuples (or other iterables of ints)
+    are accepted for backwards compatibility.
+    """
+    if not isinstance(multi_indices, tuple):
+        multi_indices = (multi_indices,)
+    return tuple(mi if isinstance(mi, bytes) else bytes(mi) for mi in multi_indices)
 
 class PolyDifferentialOperator(AlgebraElement):
     """
@@ -44,7 +61,9 @@ class PolyDifferentialOperator(AlgebraElement):
         self._coefficients = defaultdict(dict)
         for arity in coefficients:
             for (multi_indices, coefficient) in coefficients[arity].items():
-                self._coefficients[arity][multi_indices] = self._parent.base_ring()(coefficient) # conversion
+                self._coefficients[arity][_normalize_multi_indices(multi_indices)] = self._parent.base_ring()(coefficient) # conversion
+        self._nonzero_cache = None
+        self._hash = None
 
     def _repr_(self):
         """
@@ -118,12 +137,29 @@ class PolyDifferentialOperator(AlgebraElement):
                 break
         return equal if op == op_EQ else not equal
 
+    def __hash__(self):
+        """
+        Return a hash of this polydifferential operator.
+
+        .. NOTE::
+
+            The hash is computed from the nonzero coefficients and cached; it is invalidated when a coefficient is set.
+        """
+        if self._hash is None:
+            data = []
+            for arity in sorted(self._coefficients):
+                items = tuple(sorted((multi_indices, coefficient) for multi_indices, coefficient in self._coefficients[arity].items()
+                                     if not self._parent._is_zero(coefficient)))
+                if items:
+                    data.append((arity, items))
+            self._hash = hash(tuple(data))
+        return self._hash
+
     def __getitem__(self, multi_indices):
         """
         Return the coefficient of the differential monomial specified by ``multi_indices``.
         """
-        if not isinstance(multi_indices, tuple):
-            multi_indices = (multi_indices,)
+        multi_indices = _normalize_multi_indices(multi_indices)
         arity = len(multi_indices)
         return self._coefficients[arity].get(multi_indices, self._parent.base_ring().zero())
 
@@ -131,10 +167,11 @@ class PolyDifferentialOperator(AlgebraElement):
         """
         Set the coefficient of the differential monomial specified by ``multi_indices`` to ``new_value``.
         """
-        if not isinstance(multi_indices, tuple):
-            multi_indices = (multi_indices,)
+        multi_indices = _normalize_multi_indices(multi_indices)
         arity = len(multi_indices)
         self._coefficients[arity][multi_indices] = new_value
+        self._nonzero_cache = None
+        self._hash = None
 
     def multi_indices(self):
         """
@@ -177,11 +214,17 @@ class PolyDifferentialOperator(AlgebraElement):
         """
         coefficients = defaultdict(dict)
         for arity in self._coefficients:
-            for multi_indices, coefficient in self._coefficients[arity].items():
-                coefficients[arity][multi_indices] = coefficient
+            coefficients[arity] = dict(self._coefficients[arity])
         for arity in other._coefficients:
+            if arity not in coefficients:
+                coefficients[arity] = dict(other._coefficients[arity])
+                continue
+            merged = coefficients[arity]
             for multi_indices, coefficient in other._coefficients[arity].items():
-                coefficients[arity][multi_indices] = self._parent._simplify(coefficients[arity].get(multi_indices, self._parent.base_ring().zero()) + coefficient)
+                if multi_indices in merged:
+                    merged[multi_indices] = self._parent._simplify(merged[multi_indices] + coefficient)
+                else:
+                    merged[multi_indices] = coefficient
         return self.__class__(self._parent, coefficients)
 
     def _sub_(self, other):
@@ -190,45 +233,74 @@ class PolyDifferentialOperator(AlgebraElement):
         """
         coefficients = defaultdict(dict)
         for arity in self._coefficients:
-            for multi_indices, coefficient in self._coefficients[arity].items():
-                coefficients[arity][multi_indices] = coefficient
+            coefficients[arity] = dict(self._coefficients[arity])
         for arity in other._coefficients:
+            if arity not in coefficients:
+                coefficients[arity] = {multi_indices : -coefficient for multi_indices, coefficient in other._coefficients[arity].items()}
+                continue
+            merged = coefficients[arity]
             for multi_indices, coefficient in other._coefficients[arity].items():
-                coefficients[arity][multi_indices] = self._parent._simplify(coefficients[arity].get(multi_indices, self._parent.base_ring().zero()) - coefficient)
+                if multi_indices in merged:
+                    merged[multi_indices] = self._parent._simplify(merged[multi_indices] - coefficient)
+                else:
+                    merged[multi_indices] = -coefficient
         return self.__class__(self._parent, coefficients)
 
-    def insertion(self, position, other):
+    def _insertion_raw(self, position, other, coefficients, sign=1):
         """
-        Return the insertion of ``other`` into the ``position``-th argument of this polydifferential operator.
+        Accumulate the (unsimplified) terms of the insertion of ``other`` into the ``position``-th argument of this polydifferential operator into ``coefficients``, multiplied by ``sign``.
+
+        Helper for :meth:`insertion` and :meth:`_mul_`.
         """
-        coefficients = defaultdict(dict)
+        derivative_cache = {} # derivatives of the coefficients of ``other``, keyed by multi-index and derivative orders
+        coordinates = self._parent._coordinates
+        is_zero = self._parent._is_zero
+        mul_on_basis = self._parent._mul_on_basis
         for arity1 in self._coefficients:
             for multi_indices1, coefficient1 in self._coefficients[arity1].items():
-                if self._parent._is_zero(coefficient1):
+                if is_zero(coefficient1):
                     continue
                 for arity2 in other._coefficients:
                     for multi_indices2, coefficient2 in other._coefficients[arity2].items():
-                        if self._parent._is_zero(coefficient2):
+                        if is_zero(coefficient2):
                             continue
                         # product rule: split multi_indices1[position] into arity2+1 parts (1 for coefficient of other)
-                        for partition in [list(zip(*L)) for L in product(*[list(compositions(k, arity2+1)) for k in multi_indices1[position]])]:
-                            decompositions = list(zip(*partition))
+                        for L in product(*[compositions(k, arity2+1) for k in multi_indices1[position]]):
+                            partition = tuple(zip(*L))
+                            decompositions = zip(*partition)
                             multiplicity = 1
                             for decomposition in decompositions:
                                 # the number of ways to distribute a derivative over factors with the multiplicities given by decomposition is the multinomial coefficient
-                                multinomial_coefficient_denominator = reduce(mul, [reduce(mul, [j+1 for j in range(d)], 1) for d in decomposition], 1)
-                                multinomial_coefficient_numerator = reduce(mul, [k+1 for k in range(sum(decomposition))], 1)
-                                multinomial_coefficient = multinomial_coefficient_numerator // multinomial_coefficient_denominator
-                                multiplicity *= multinomial_coefficient
-                            prod = multi_indices1[:position] + self._parent._mul_on_basis(partition[:-1], multi_indices2) + multi_indices1[position+1:]
-                            coeff = coefficient2
-                            for k in range(len(partition[-1])):
-                                for _ in range(partition[-1][k]):
-                                    coeff = coeff.derivative(self._parent.coordinate(k))
-                            coeff *= coefficient1 * multiplicity
-                            if self._parent._is_zero(coeff):
-                                continue
-                            coefficients[arity1 + arity2 - 1][prod] = self._parent._simplify(coefficients[arity1 + arity2 - 1].get(prod, self._parent.base_ring().zero()) + coeff)
+                                remaining = sum(decomposition)
+                                for d in decomposition:
+                                    multiplicity *= comb(remaining, d)
+                                    remaining -= d
+                            prod_multi_indices = multi_indices1[:position] + mul_on_basis(partition[:-1], multi_indices2) + multi_indices1[position+1:]
+                            orders = partition[-1]
+                            if not any(orders):
+                                coeff = coefficient2 # no derivatives fall on the coefficient
+                            else:
+                                coeff = derivative_cache.get((multi_indices2, orders))
+                                if coeff is None:
+                                    coeff = coefficient2
+                                    for k in range(len(orders)):
+                                        for _ in range(orders[k]):
+                                            coeff = coeff.derivative(coordinates[k])
+                                    derivative_cache[(multi_indices2, orders)] = coeff
+                            coeff = coeff * coefficient1 * (sign * multiplicity)
+                            accumulated = coefficients[arity1 + arity2 - 1]
+                            if prod_multi_indices in accumulated:
+                                accumulated[prod_multi_indices] += coeff
+                            else:
+                                accumulated[prod_multi_indices] = coeff
+
+    def insertion(self, position, other):
+        """
+        Return the insertion of ``other`` into the ``position``-th argument of this polydifferential operator.
+        """
+        coefficients = defaultdict(dict)
+        self._insertion_raw(position, other, coefficients)
+        self._parent._simplify_coefficients(coefficients)
         return self.__class__(self._parent, coefficients)
 
     def _mul_(self, other):
@@ -240,7 +312,12 @@ class PolyDifferentialOperator(AlgebraElement):
             This is the pre-Lie product, a sum (with signs) of insertions of ``other`` into this polydifferential operator.
             For unary operators, this is composition.
         """
-        return sum((1 if (i*(other.arity()-1)) % 2 == 0 else -1)*self.insertion(i, other) for i in range(self.arity()))
+        coefficients = defaultdict(dict)
+        arity2 = other.arity()
+        for i in range(self.arity()):
+            self._insertion_raw(i, other, coefficients, sign=1 if (i*(arity2-1)) % 2 == 0 else -1)
+        self._parent._simplify_coefficients(coefficients)
+        return self.__class__(self._parent, coefficients)
 
     def _lmul_(self, other):
         """
@@ -265,18 +342,29 @@ class PolyDifferentialOperator(AlgebraElement):
     def _pow_(self, exponent):
         """
         Return this polydifferential operator raised to the power ``exponent``.
+
+        .. NOTE::
+
+            The product is the (non-associative) pre-Lie product, and the power is left-nested: ``((self*self)*self)*...``.
         """
-        return reduce(mul, [self]*exponent, self._parent.identity_operator())
+        if exponent < 0:
+            raise ValueError('exponent must be a natural number')
+        if exponent == 0:
+            return self._parent.identity_operator()
+        result = self
+        for _ in range(exponent - 1):
+            result = result * self
+        return result
 
     def __bool__(self):
         """
         Return ``False`` if this polydifferential operator equals zero and ``True`` otherwise.
         """
-        for arity in self._coefficients:
-            for coefficient in self._coefficients[arity].values():
-                if not self._parent._is_zero(coefficient):
-                    return True
-        return False
+        if self._nonzero_cache is None:
+            self._nonzero_cache = any(not self._parent._is_zero(coefficient)
+                                      for arity in self._coefficients
+                                      for coefficient in self._coefficients[arity].values())
+        return self._nonzero_cache
 
     def arity(self):
         """
@@ -286,7 +374,10 @@ class PolyDifferentialOperator(AlgebraElement):
 
             Assumes this polydifferential operator is homogeneous.
         """
-        return next(iter(self._coefficients), 0)
+        for arity in self._coefficients:
+            if self._coefficients[arity]:
+                return arity
+        return 0
 
     def gerstenhaber_bracket(self, other):
         """
@@ -319,10 +410,16 @@ class PolyDifferentialOperator(AlgebraElement):
         Return the polydifferential operator which is the symmetrization of this polydifferential operator.
         """
         coefficients = defaultdict(dict)
+        zero = self._parent.base_ring().zero()
         for arity in self._coefficients:
             for multi_indices, coefficient in self._coefficients[arity].items():
-                for multi_indices_permuted in permutations(multi_indices):
-                    coefficients[arity][multi_indices_permuted] = coefficients[arity].get(multi_indices_permuted, self._parent.base_ring().zero()) + coefficient
+                distinct_permutations = dict.fromkeys(permutations(multi_indices))
+                # by orbit-stabilizer, each distinct arrangement arises equally often
+                stabilizer_order = factorial(arity) // len(distinct_permutations)
+                if stabilizer_order > 1:
+                    coefficient = stabilizer_order * coefficient
+                for multi_indices_permuted in distinct_permutations:
+                    coefficients[arity][multi_indices_permuted] = coefficients[arity].get(multi_indices_permuted, zero) + coefficient
         return self.__class__(self._parent, coefficients)
 
     def skew_symmetrization(self):
@@ -331,13 +428,14 @@ class PolyDifferentialOperator(AlgebraElement):
         """
         from gcaops.util.permutation import selection_sort
         coefficients = defaultdict(dict)
+        zero = self._parent.base_ring().zero()
         for arity in self._coefficients:
             arguments = list(range(arity))
+            signed_permutations = [(sigma, selection_sort(list(sigma))) for sigma in permutations(arguments)]
             for multi_indices, coefficient in self._coefficients[arity].items():
-                for sigma in permutations(arguments):
-                    sign = selection_sort(list(sigma))
+                for sigma, sign in signed_permutations:
                     multi_indices_permuted = tuple([multi_indices[sigma[k]] for k in range(arity)])
-                    coefficients[arity][multi_indices_permuted] = coefficients[arity].get(multi_indices_permuted, self._parent.base_ring().zero()) + sign*coefficient
+                    coefficients[arity][multi_indices_permuted] = coefficients[arity].get(multi_indices_permuted, zero) + sign*coefficient
         return self.__class__(self._parent, coefficients)
 
 def identity(x):
@@ -387,7 +485,7 @@ class PolyDifferentialOperatorAlgebra(UniqueRepresentation, Parent):
             raise ValueError("Number of derivative names in {} does not match number of coordinates".format(names))
         self._names = tuple(names)
         self.__ngens = len(names)
-        self._gens = tuple(self.element_class(self, {1 : {(tuple(1 if j == k else 0 for j in range(self.__ngens)),) : self.base_ring().one() } }) for k in range(self.__ngens))
+        self._gens = tuple(self.element_class(self, {1 : {(bytes(1 if j == k else 0 for j in range(self.__ngens)),) : self.base_ring().one() } }) for k in range(self.__ngens))
         if simplify is None:
             self._simplify = identity
         else:
@@ -456,8 +554,8 @@ class PolyDifferentialOperatorAlgebra(UniqueRepresentation, Parent):
             else:
                 raise ValueError('cannot convert {} into element of {}'.format(arg, self))
         elif arg in self.base_ring():
-            zero_multi_index = tuple(0 for i in range(self.__ngens))
-            return self.element_class(self, { 1 : {tuple([zero_multi_index]) : arg} })
+            zero_multi_index = bytes(self.__ngens)
+            return self.element_class(self, { 1 : {(zero_multi_index,) : arg} })
         else:
             raise ValueError('cannot convert {} into element of {}'.format(arg, self))
 
@@ -486,8 +584,12 @@ class PolyDifferentialOperatorAlgebra(UniqueRepresentation, Parent):
         coefficients = defaultdict(dict)
         for multi_indices in product(*[arg._coefficients[1] for arg in args]):
             multi_index = sum(multi_indices, tuple())
-            coeff = reduce(mul, (arg._coefficients[1][multi_index] for (arg, multi_index) in zip(args, multi_indices)), self.base_ring().one())
-            coefficients[arity][multi_index] = self._simplify(coefficients[arity].get(multi_index, self.base_ring().zero()) + coeff)
+            coeff = prod((arg._coefficients[1][multi_index] for (arg, multi_index) in zip(args, multi_indices)), start=self.base_ring().one())
+            if multi_index in coefficients[arity]:
+                coefficients[arity][multi_index] += coeff
+            else:
+                coefficients[arity][multi_index] = coeff
+        self._simplify_coefficients(coefficients)
         return self.element_class(self, coefficients)
 
     def coordinates(self):
@@ -556,6 +658,19 @@ class PolyDifferentialOperatorAlgebra(UniqueRepresentation, Parent):
         else:
             return '(' + factors_str + ')'
 
+    def _simplify_coefficients(self, coefficients):
+        """
+        Simplify the accumulated ``coefficients`` in place, dropping coefficients that simplify to zero.
+        """
+        for arity in coefficients:
+            simplified = {}
+            for multi_indices, coefficient in coefficients[arity].items():
+                coefficient = self._simplify(coefficient)
+                if not self._is_zero(coefficient):
+                    simplified[multi_indices] = coefficient
+            coefficients[arity] = simplified
+
+    @lru_cache(maxsize=65536)
     def _mul_on_basis(self, multi_indices1, multi_indices2):
         """
         Return the multi-index that results from multiplying the differential monomial given by ``multi_indices1`` by the differential monomial given by ``multi_indices2``.
@@ -563,19 +678,19 @@ class PolyDifferentialOperatorAlgebra(UniqueRepresentation, Parent):
         assert len(multi_indices1) == len(multi_indices2)
         multi_indices = []
         for (multi_index1, multi_index2) in zip(multi_indices1, multi_indices2):
-            multi_indices.append(tuple(multi_index1[i] + multi_index2[i] for i in range(self.__ngens)))
+            multi_indices.append(bytes(multi_index1[i] + multi_index2[i] for i in range(self.__ngens)))
         return tuple(multi_indices)
 
     def identity_operator(self):
         """
         Return the (unary) identity operator of this polydifferential operator algebra.
         """
-        zero_multi_index = tuple(0 for i in range(self.__ngens))
+        zero_multi_index = bytes(self.__ngens)
         return self.element_class(self, {1 : { (zero_multi_index,) : self.base_ring().one()} })
 
     def multiplication_operator(self):
         """
         Return the (binary) multiplication operator of this polydifferential operator algebra.
         """
-        zero_multi_index = tuple(0 for i in range(self.__ngens))
+        zero_multi_index = bytes(self.__ngens)
         return self.element_class(self, {2 : { (zero_multi_index, zero_multi_index) : self.base_ring().one()} })
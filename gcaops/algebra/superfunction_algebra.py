@@ -1,11 +1,11 @@
 r"""
 Superfunction algebra
 """
-from collections import defaultdict
 from collections.abc import Iterable, MutableMapping
-from functools import reduce, partial
+from functools import lru_cache, reduce, partial
 from gcaops.util.misc import keydefaultdict
 from gcaops.util.permutation import selection_sort
+from sage.functions.other import binomial
 from sage.structure.unique_representation import UniqueRepresentation
 from sage.structure.parent import Parent
 from sage.structure.element import AlgebraElement
@@ -38,9 +38,21 @@ class Superfunction(AlgebraElement):
         self._parent = parent
         if not isinstance(monomial_coeffs, MutableMapping):
             raise TypeError('monomial_coeffs must be a dictionary')
-        self._monomial_coeffs = defaultdict(self._parent.base_ring().zero)
-        for m in monomial_coeffs:
-            self._monomial_coeffs[m] = self._parent.base_ring()(monomial_coeffs[m]) # Conversion.
+        base_ring = self._parent.base_ring()
+        self._monomial_coeffs = {m : base_ring(c) for m, c in monomial_coeffs.items()} # Conversion.
+
+    @classmethod
+    def _new(cls, parent, monomial_coeffs):
+        """
+        Return a new superfunction with the given dictionary of monomial coefficients, skipping validation and conversion.
+
+        For internal use in operations whose result coefficients are already elements of the base ring.
+        """
+        result = cls.__new__(cls)
+        AlgebraElement.__init__(result, parent)
+        result._parent = parent
+        result._monomial_coeffs = monomial_coeffs
+        return result
 
     def _repr_(self):
         """
@@ -50,10 +62,10 @@ class Superfunction(AlgebraElement):
         for degree in reversed(sorted(self.degrees())):
             for m in sorted(self._indices(degree)):
                 coefficient = self._monomial_coeffs[m]
-                c = repr(coefficient)
-                if c == '0':
+                if self._parent._is_zero(coefficient):
                     continue
-                elif c == '1' and degree > 0: # mainly for generators and basis
+                c = repr(coefficient)
+                if c == '1' and degree > 0: # mainly for generators and basis
                     term = self._parent._repr_monomial(m)
                 elif degree == 0:
                     term = '({})'.format(c)
@@ -74,10 +86,10 @@ class Superfunction(AlgebraElement):
         for degree in reversed(sorted(self.degrees())):
             for m in sorted(self._indices(degree)):
                 coefficient = self._monomial_coeffs[m]
+                if self._parent._is_zero(coefficient):
+                    continue
                 c = coefficient._latex_()
                 monomial = self._parent._repr_monomial(m).replace('*', '')
-                if c == '0':
-                    continue
                 if degree == 0:
                     monomial = ''
                     prefix = c
@@ -104,8 +116,16 @@ class Superfunction(AlgebraElement):
             return NotImplemented
         # TODO: Optimize?
         equal = True
-        for m in set(self._monomial_coeffs.keys()) | set(other._monomial_coeffs.keys()):
-            if not self._parent._is_zero(self._parent._simplify(self._monomial_coeffs[m] - other._monomial_coeffs[m])):
+        for m in self._monomial_coeffs.keys() | other._monomial_coeffs.keys():
+            c1 = self._monomial_coeffs.get(m)
+            c2 = other._monomial_coeffs.get(m)
+            if c1 is None:
+                difference = c2 # sign is irrelevant for the zero test
+            elif c2 is None:
+                difference = c1
+            else:
+                difference = c1 - c2
+            if not self._parent._is_zero(self._parent._simplify(difference)):
                 equal = False
                 break
         return equal if op == op_EQ else not equal
@@ -132,9 +152,9 @@ class Superfunction(AlgebraElement):
             indices = (indices,)
         sign, index = self._parent._monomial_index(indices)
         if index is None:
-            value = self._parent.base_ring().zero()
+            value = self._parent._zero
         else:
-            value = self._monomial_coeffs[index]
+            value = self._monomial_coeffs.get(index, self._parent._zero)
         return sign * value
 
     def __setitem__(self, indices, new_value):
@@ -179,7 +199,7 @@ class Superfunction(AlgebraElement):
 
             Returns a :class:`Superfunction` whose homogeneous component of degree ``degree`` is a *reference* to the respective component of this superfunction.
         """
-        return self.__class__(self._parent, { m : self._monomial_coeffs[m] for m in self._indices(degree) })
+        return self._new(self._parent, { m : self._monomial_coeffs[m] for m in self._indices(degree) })
 
     def map_coefficients(self, f, new_parent=None):
         """
@@ -187,50 +207,66 @@ class Superfunction(AlgebraElement):
         """
         if new_parent is None:
             new_parent = self._parent
-        monomial_coeffs = defaultdict(new_parent.base_ring().zero)
-        for m in self._monomial_coeffs:
-            monomial_coeffs[m] = new_parent._simplify(f(self._monomial_coeffs[m]))
+        monomial_coeffs = {m : new_parent._simplify(f(c)) for m, c in self._monomial_coeffs.items()}
         return self.__class__(new_parent, monomial_coeffs)
 
     def _neg_(self):
         """
         Return the negative of this superfunction.
         """
-        return self.map_coefficients(lambda c: -c)
+        return self._new(self._parent, {m : -c for m, c in self._monomial_coeffs.items()})
 
     def _add_(self, other):
         """
         Return this superfunction added to ``other``.
         """
-        monomial_coeffs = defaultdict(self._parent.base_ring().zero, self._monomial_coeffs)
-        for m in other._monomial_coeffs:
-            monomial_coeffs[m] = self._parent._simplify(monomial_coeffs[m] + other._monomial_coeffs[m])
-        return self.__class__(self._parent, monomial_coeffs)
+        monomial_coeffs = dict(self._monomial_coeffs)
+        for m, c in other._monomial_coeffs.items():
+            if m in monomial_coeffs:
+                monomial_coeffs[m] = self._parent._simplify(monomial_coeffs[m] + c)
+            else:
+                monomial_coeffs[m] = c
+        return self._new(self._parent, monomial_coeffs)
 
     def _sub_(self, other):
         """
         Return this superfunction minus ``other``.
         """
-        monomial_coeffs = defaultdict(self._parent.base_ring().zero, self._monomial_coeffs)
-        for m in other._monomial_coeffs:
-            monomial_coeffs[m] = self._parent._simplify(monomial_coeffs[m] - other._monomial_coeffs[m])
-        return self.__class__(self._parent, monomial_coeffs)
+        monomial_coeffs = dict(self._monomial_coeffs)
+        for m, c in other._monomial_coeffs.items():
+            if m in monomial_coeffs:
+                monomial_coeffs[m] = self._parent._simplify(monomial_coeffs[m] - c)
+            else:
+                monomial_coeffs[m] = -c
+        return self._new(self._parent, monomial_coeffs)
 
     def _mul_(self, other):
         """
         Return this superfunction multiplied by ``other`` on the right.
         """
-        monomial_coeffs = defaultdict(self._parent.base_ring().zero)
-        for m1 in self._monomial_coeffs:
-            if self._parent._is_zero(self._monomial_coeffs[m1]):
+        is_zero = self._parent._is_zero
+        simplify = self._parent._simplify
+        mul_on_basis = self._parent._mul_on_basis
+        monomial_coeffs = {}
+        for m1, c1 in self._monomial_coeffs.items():
+            if is_zero(c1):
                 continue
-            for m2 in other._monomial_coeffs:
-                if self._parent._is_zero(other._monomial_coeffs[m2]):
+            for m2, c2 in other._monomial_coeffs.items():
+                if is_zero(c2):
+                    continue
+                prod, sign = mul_on_basis(m1, m2)
+                if prod is None:
                     continue
-                prod, sign = self._parent._mul_on_basis(m1, m2)
-                if prod is not None:
-                    monomial_coeffs[prod] = self._parent._simplify(monomial_coeffs[prod] + sign * self._monomial_coeffs[m1] * other._monomial_coeffs[m2])
-        return self.__class__(self._parent, monomial_coeffs)
+                term = c1 * c2
+                if sign < 0:
+                    term = -term
+                if prod in monomial_coeffs:
+                    monomial_coeffs[prod] += term
+                else:
+                    monomial_coeffs[prod] = term
+        for m in monomial_coeffs:
+            monomial_coeffs[m] = simplify(monomial_coeffs[m])
+        return self._new(self._parent, monomial_coeffs)
 
     def _lmul_(self, other):
         """
@@ -241,10 +277,8 @@ class Superfunction(AlgebraElement):
             This assumes that ``other`` commutes with this superfunction.
             It is justified because this function only gets called when ``other`` is even.
         """
-        monomial_coeffs = defaultdict(self._parent.base_ring().zero)
-        for m in self._monomial_coeffs:
-            monomial_coeffs[m] = self._parent._simplify(self._monomial_coeffs[m] * other)
-        return self.__class__(self._parent, monomial_coeffs)
+        monomial_coeffs = {m : self._parent._simplify(c * other) for m, c in self._monomial_coeffs.items()}
+        return self._new(self._parent, monomial_coeffs)
 
     def _div_(self, other):
         """
@@ -300,17 +334,15 @@ class Superfunction(AlgebraElement):
         """
         if len(args) == 1 and any(args[0] is xi for xi in self._parent.gens()):
             j = self._parent.gens().index(args[0])
-            monomial_coeffs = defaultdict(self._parent.base_ring().zero)
-            for m in self._monomial_coeffs:
+            monomial_coeffs = {}
+            for m, c in self._monomial_coeffs.items():
                 derivative, sign = self._parent._derivative_on_basis(m, j)
                 if derivative is not None:
-                    monomial_coeffs[derivative] = self._parent._simplify(sign * self._monomial_coeffs[m])
-            return self.__class__(self._parent, monomial_coeffs)
+                    monomial_coeffs[derivative] = self._parent._simplify(sign * c)
+            return self._new(self._parent, monomial_coeffs)
         elif len(args) == 1 and any(args[0] is x for x in self._parent.even_coordinates()):
-            monomial_coeffs = defaultdict(self._parent.base_ring().zero)
-            for m in self._monomial_coeffs:
-                monomial_coeffs[m] = self._parent._simplify(self._monomial_coeffs[m].derivative(args[0]))
-            return self.__class__(self._parent, monomial_coeffs)
+            monomial_coeffs = {m : self._parent._simplify(c.derivative(args[0])) for m, c in self._monomial_coeffs.items()}
+            return self._new(self._parent, monomial_coeffs)
         elif len(args) == 1:
             # by now we know args[0] is not identically a coordinate, but maybe it is equal to one:
             try:
@@ -402,6 +434,7 @@ class SuperfunctionAlgebra(UniqueRepresentation, Parent):
             raise ValueError("Number of odd coordinate names in {} does not match number of even coordinates".format(names))
         self._names = tuple(names)
         self.__ngens = len(names)
+        self._zero = self.base_ring().zero() # shared zero coefficient
         self._gens = tuple(self.element_class(self, {1 << m : self.base_ring().one()}) for m in range(self.__ngens))
         if simplify is None:
             self._simplify = identity
@@ -455,8 +488,6 @@ class SuperfunctionAlgebra(UniqueRepresentation, Parent):
                     return arg.map_coefficients(self.base_ring(), new_parent=self)
                 except:
                     raise ValueError('cannot convert {} into element of {}'.format(arg, self))
-        elif arg in self.base_ring():
-            return self.element_class(self, { 0 : self.base_ring()(arg) })
         from .polydifferential_operator import PolyDifferentialOperator
         if isinstance(arg, PolyDifferentialOperator):
             if arg.parent().base_ring() is self.base_ring():
@@ -477,6 +508,8 @@ class SuperfunctionAlgebra(UniqueRepresentation, Parent):
                 return result
             else:
                 raise ValueError('cannot convert {} into element of {}'.format(arg, self))
+        elif arg in self.base_ring():
+            return self.element_class(self, { 0 : self.base_ring()(arg) })
         else:
             raise ValueError('cannot convert {} into element of {}'.format(arg, self))
 
@@ -531,6 +564,7 @@ class SuperfunctionAlgebra(UniqueRepresentation, Parent):
 
     odd_coordinate = gen
 
+    @lru_cache(maxsize=None)
     def _repr_monomial(self, monomial_index):
         """
         Return a string representation of the respective monomial in the odd coordinates.
@@ -549,7 +583,6 @@ class SuperfunctionAlgebra(UniqueRepresentation, Parent):
 
         - ``degree`` -- a natural number
         """
-        from sage.functions.other import binomial
         if degree is None:
             return 1 << self.__ngens
         else:
@@ -575,40 +608,32 @@ class SuperfunctionAlgebra(UniqueRepresentation, Parent):
             return 1, None
 
     def _index_to_tuple(self, monomial_index):
-        # TODO: optimize?
         multi_index = []
-        index = 0
-        bit = 1
-        for i in range(self.__ngens):
-            if monomial_index & bit:
-                multi_index.append(index)
-            bit <<= 1
-            index += 1
+        while monomial_index:
+            bit = monomial_index & -monomial_index
+            multi_index.append(bit.bit_length() - 1)
+            monomial_index ^= bit
         return tuple(multi_index)
 
     def _monomial_degree(self, monomial_index):
         # TODO: in Python 3.10, return monomial_index.bit_count()
-        degree = 0
-        bit = 1
-        for i in range(self.__ngens):
-            if monomial_index & bit:
-                degree += 1
-            bit <<= 1
-        return degree
+        return bin(monomial_index).count('1')
 
+    @lru_cache(maxsize=65536)
     def _mul_on_basis(self, m1, m2):
         """
         Return the index and the sign of the monomial that results from multiplying the monomial represented by ``m1`` by the monomial represented by ``m2``.
         """
         if m1 & m2 != 0:
             return None, 1
-        prod = m1 | m2
-        # TODO: optimize?
-        left = self._index_to_tuple(m1)
-        right = self._index_to_tuple(m2)
-        lst = list(left+right)
-        sign = selection_sort(lst)
-        return prod, sign
+        # Koszul sign: count the inversions between the bits of m1 and m2
+        inversions = 0
+        b = m2
+        while b:
+            bit = b & -b
+            inversions += bin(m1 >> bit.bit_length()).count('1')
+            b ^= bit
+        return m1 | m2, -1 if inversions % 2 else 1
 
     def _derivative_on_basis(self, m, j):
         """
@@ -616,10 +641,8 @@ class SuperfunctionAlgebra(UniqueRepresentation, Parent):
         """
         if m & (1 << j) == 0:
             return None, 1
-        # TODO: optimize?
-        monomial = self._index_to_tuple(m)
-        lst = list(monomial)
-        sign = 1 if lst.index(j) % 2 == 0 else -1
+        # sign: parity of the number of odd coordinates preceding the j-th in the monomial
+        sign = -1 if bin(m & ((1 << j) - 1)).count('1') % 2 else 1
         return m ^ (1 << j), sign
 
     def tensor_power(self, n):
@@ -173,6 +173,22 @@ class FormalityGraph:
         """
         return isinstance(other, self.__class__) and self._num_ground_vertices == other._num_ground_vertices and self._num_aerial_vertices == other._num_aerial_vertices and self._edges == other._edges
 
+    def __hash__(self):
+        """
+        Return a hash of this graph, computed from the vertex counts and the ordered list of edges (consistently with :meth:`__eq__`).
+
+        .. NOTE::
+
+            Graphs are mutable (e.g. by :meth:`canonicalize_edges`), so a graph must not be mutated while it is in use as a dictionary key.
+
+        EXAMPLES::
+
+            sage: g = FormalityGraph(2, 1, [(2, 0), (2, 1)])
+            sage: hash(g) == hash(g.copy())
+            True
+        """
+        return hash((self._num_ground_vertices, self._num_aerial_vertices, tuple(self._edges)))
+
     def num_ground_vertices(self):
         """
         Return the number of ground vertices of this graph.
@@ -197,6 +213,18 @@ class FormalityGraph:
         """
         return self._num_aerial_vertices
 
+    def num_edges(self):
+        """
+        Return the number of edges of this graph.
+
+        EXAMPLES::
+
+            sage: g = FormalityGraph(2, 1, [(2, 0), (2, 1)])
+            sage: g.num_edges()
+            2
+        """
+        return len(self._edges)
+
     def edges(self):
         """
         Return the list of edges of this graph.
@@ -7,6 +7,14 @@ from .formality_graph import FormalityGraph
 from .graph_basis import GraphBasis
 from .graph_cache import formality_graph_cache
 
+canonicalize_graph = formality_graph_cache.canonicalize_graph # bound once; used in the hot key lookups
+
+def graph_index(graphs_dict, key):
+    """
+    Return a dictionary mapping the edge tuple of each graph in ``graphs_dict[key]`` to its index in the list.
+    """
+    return {tuple(g.edges()) : index for index, g in enumerate(graphs_dict[key])}
+
 class FormalityGraphBasis(GraphBasis):
     """
     Basis of a module spanned by formality graphs.
@@ -28,6 +36,7 @@ class FormalityGraphComplexBasis(FormalityGraphBasis):
         self._connected = connected
         self._loops = loops
         self._graphs = keydefaultdict(partial(formality_graph_cache.graphs, positive_differential_order=positive_differential_order, connected=connected, loops=loops, has_odd_automorphism=False))
+        self._graph_index = keydefaultdict(partial(graph_index, self._graphs))
 
     def graph_to_key(self, graph):
         """
@@ -41,13 +50,12 @@ class FormalityGraphComplexBasis(FormalityGraphBasis):
 
         Either ``(None, 1)`` if the input ``graph`` is not in the span of the basis, or a tuple consisting of a key and a sign, where a key is a tuple consisting of the number of ground vertices, the number of aerial vertices, the number of edges, and the index of the graph in the list.
         """
-        g, _, sign = formality_graph_cache.canonicalize_graph(graph)
-        gv, av, e = g.num_ground_vertices(), g.num_aerial_vertices(), len(g.edges())
-        try:
-            index = self._graphs[gv,av,e].index(g)
-            return (gv,av,e,index), sign
-        except ValueError:
+        g, _, sign = canonicalize_graph(graph)
+        gv, av, e = g.num_ground_vertices(), g.num_aerial_vertices(), g.num_edges()
+        index = self._graph_index[gv,av,e].get(tuple(g.edges()))
+        if index is None:
             return None, 1
+        return (gv,av,e,index), sign
 
     def key_to_graph(self, key):
         """
@@ -90,11 +98,18 @@ class FormalityGraphComplexBasis(FormalityGraphBasis):
         """
         return {'positive_differential_order' : self._positive_differential_order, 'connected' : self._connected, 'loops' : self._loops, 'has_odd_automorphism' : False}
 
+    _last_graphs_key = None
+    _last_graphs = None
+
     def graphs(self, num_ground_vertices, num_aerial_vertices, num_edges):
         """
         Return the list of graphs in this basis with the given ``num_ground_vertices``, ``num_aerial_vertices`` and ``num_edges``.
         """
-        return self._graphs[num_ground_vertices, num_aerial_vertices, num_edges]
+        key = (num_ground_vertices, num_aerial_vertices, num_edges)
+        if key != self._last_graphs_key:
+            self._last_graphs = self._graphs[key]
+            self._last_graphs_key = key
+        return self._last_graphs
 
     def cardinality(self, num_ground_vertices, num_aerial_vertices, num_edges):
         """
@@ -106,6 +121,13 @@ class FormalityGraphComplexBasis_lazy(FormalityGraphComplexBasis):
     """
     Basis consisting of representatives of isomorphism classes of formality graphs with no automorphisms that induce an odd permutation on edges.
     """
+    def __init__(self, positive_differential_order=None, connected=None, loops=None):
+        """
+        Initialize this basis.
+        """
+        super().__init__(positive_differential_order=positive_differential_order, connected=connected, loops=loops)
+        self._odd_automorphism_cache = {}
+
     def graph_to_key(self, graph):
         """
         Return a tuple consisting of the key in this basis and the sign factor such that ``graph`` equals the sign times the graph identified by the key.
@@ -118,11 +140,18 @@ class FormalityGraphComplexBasis_lazy(FormalityGraphComplexBasis):
 
         Either ``(None, 1)`` if the input ``graph`` is not in the span of the basis, or a tuple consisting of a key and a sign, where a key is a tuple containing the number of ground vertices, the number of aerial vertices, and the number of edges, followed by all the edges in the graph.
         """
-        if graph.has_odd_automorphism():
+        g, _, sign = canonicalize_graph(graph)
+        gv, av, e = g.num_ground_vertices(), g.num_aerial_vertices(), g.num_edges()
+        edges = tuple(g.edges())
+        # the parity of automorphisms is isomorphism invariant, so it can be
+        # checked on (and cached for) the canonical form
+        odd = self._odd_automorphism_cache.get((gv, av, edges))
+        if odd is None:
+            odd = g.has_odd_automorphism()
+            self._odd_automorphism_cache[(gv, av, edges)] = odd
+        if odd:
             return None, 1
-        g, _, sign = formality_graph_cache.canonicalize_graph(graph)
-        gv, av, e = g.num_ground_vertices(), g.num_aerial_vertices(), len(g.edges())
-        return (gv,av,e) + tuple(g.edges()), sign
+        return (gv,av,e) + edges, sign
 
     def key_to_graph(self, key):
         """
@@ -154,6 +183,7 @@ class FormalityGraphOperadBasis(FormalityGraphBasis):
         self._connected = connected
         self._loops = loops
         self._graphs = keydefaultdict(partial(formality_graph_cache.graphs, positive_differential_order=positive_differential_order, connected=connected, loops=loops, has_odd_automorphism=False))
+        self._graph_index = keydefaultdict(partial(graph_index, self._graphs))
 
     def graph_to_key(self, graph):
         """
@@ -167,13 +197,12 @@ class FormalityGraphOperadBasis(FormalityGraphBasis):
 
         Either ``(None, 1)`` if the input ``graph`` is not in the span of the basis, or a tuple consisting of a key and a sign, where a key is a tuple consisting of the number of ground vertices, the number of aerial vertices, the number of edges, the index of the graph in the list, followed by a permutation of vertices.
         """
-        g, undo_canonicalize, sign = formality_graph_cache.canonicalize_graph(graph)
-        gv, av, e = g.num_ground_vertices(), g.num_aerial_vertices(), len(g.edges())
-        try:
-            index = self._graphs[gv,av,e].index(g)
-            return (gv,av,e,index) + tuple(undo_canonicalize), sign
-        except ValueError:
+        g, undo_canonicalize, sign = canonicalize_graph(graph)
+        gv, av, e = g.num_ground_vertices(), g.num_aerial_vertices(), g.num_edges()
+        index = self._graph_index[gv,av,e].get(tuple(g.edges()))
+        if index is None:
             return None, 1
+        return (gv,av,e,index) + tuple(undo_canonicalize), sign
 
     def key_to_graph(self, key):
         """
@@ -237,13 +266,18 @@ class QuantizationGraphBasis(GraphBasis):
 
         Either ``(None, 1)`` if the input ``graph`` is not in the span of the basis, or a tuple consisting of a key and a sign, where a key is a tuple consisting of the number of ground vertices, the number of aerial vertices, the number of edges, and the index of the graph in the list.
         """
-        g, _, sign = formality_graph_cache.canonicalize_graph(graph)
-        gv, av, e = g.num_ground_vertices(), g.num_aerial_vertices(), len(g.edges())
-        try:
-            index = self._graphs[gv,av].index(g)
-            return (gv,av,index), sign
-        except ValueError:
-            return None, 1
+        fingerprint = (graph.num_ground_vertices(), graph.num_aerial_vertices(), tuple(graph.edges()))
+        result = self._key_cache.get(fingerprint)
+        if result is None:
+            g, _, sign = canonicalize_graph(graph)
+            gv, av = g.num_ground_vertices(), g.num_aerial_vertices()
+            index = self._graph_index[gv,av].get(tuple(g.edges()))
+            if index is None:
+                result = (None, 1)
+            else:
+                result = ((gv,av,index), sign)
+            self._key_cache[fingerprint] = result
+        return result
 
     def key_to_graph(self, key):
         """
@@ -290,11 +324,18 @@ class QuantizationGraphBasis(GraphBasis):
         """
         return {'positive_differential_order' : self._positive_differential_order, 'connected' : self._connected, 'loops' : self._loops, 'mod_ground_permutations' : self._mod_ground_permutations, 'max_aerial_in_degree' : self._max_aerial_in_degree, 'has_odd_automorphism' : False}
 
+    _last_graphs_key = None
+    _last_graphs = None
+
     def graphs(self, num_ground_vertices, num_aerial_vertices):
         """
         Return the list of graphs in this basis with the given ``num_ground_vertices`` and ``num_aerial_vertices``.
         """
-        return self._graphs[num_ground_vertices, num_aerial_vertices]
+        key = (num_ground_vertices, num_aerial_vertices)
+        if key != self._last_graphs_key:
+            self._last_graphs = self._graphs[key]
+            self._last_graphs_key = key
+        return self._last_graphs
 
     def cardinality(self, num_ground_vertices, num_aerial_vertices):
         """
@@ -312,18 +353,24 @@ class QuantizationGraphBasis(GraphBasis):
         cyclic = [num_ground_vertices - 1] + list(range(num_ground_vertices - 1)) + list(range(num_ground_vertices, num_vertices))
         formality_graphs = self.graphs(num_ground_vertices, num_aerial_vertices)
         num_edges = 2*num_aerial_vertices - 2 + num_ground_vertices
-        from itertools import combinations
         def redirect_subsets_of_edges(edges, redirect_to):
             good_indices = [k for k in range(len(edges)) if edges[k][1] != redirect_to]
-            for num_redirects in range(len(good_indices)+1):
-                for indices in combinations(good_indices, num_redirects):
-                    new_edges = list(edges)
-                    for idx in indices:
-                        new_edges[idx] = (new_edges[idx][0], redirect_to)
-                    yield new_edges
+            for mask in range(1 << len(good_indices)):
+                new_edges = list(edges)
+                remaining = mask
+                while remaining:
+                    bit = remaining & -remaining
+                    idx = good_indices[bit.bit_length() - 1]
+                    new_edges[idx] = (new_edges[idx][0], redirect_to)
+                    remaining ^= bit
+                yield new_edges
+        from gcaops.util.permutation import selection_sort
         from sage.rings.rational_field import QQ
         from sage.matrix.constructor import matrix
-        C = matrix(QQ, len(formality_graphs), len(formality_graphs), sparse=True)
+        entries = {}
+        # candidates that differ only by the order of their edges share the
+        # basis index and coefficient up to the parity of the edge permutation
+        redirect_cache = {}
         for i in range(len(formality_graphs)):
             g = formality_graphs[i]
             pre_lhs = g.relabeled(cyclic)
@@ -331,27 +378,41 @@ class QuantizationGraphBasis(GraphBasis):
             assert lhs_key is not None
             lhs_idx = lhs_key[self.grading_size]
             lhs_coeff *= (-1 if num_ground_vertices % 2 == 0 else 1)
-            C[i,lhs_idx] = lhs_coeff
+            entries[i,lhs_idx] = lhs_coeff
             redirect_to = 0
             for edges in redirect_subsets_of_edges(g.edges(), redirect_to):
                 # double edges:
                 if len(set(edges)) != len(edges):
                     continue
-                h = FormalityGraph(num_ground_vertices, num_aerial_vertices, edges)
                 # not positive differential order (weight vanishes):
-                if 0 in h.in_degrees()[:num_ground_vertices]:
+                differential_orders = [0]*num_ground_vertices
+                for _, b in edges:
+                    if b < num_ground_vertices:
+                        differential_orders[b] += 1
+                if 0 in differential_orders:
+                    continue
+                edges_sorted = list(edges)
+                perm_sign = selection_sort(edges_sorted)
+                fingerprint = tuple(edges_sorted)
+                cached = redirect_cache.get(fingerprint)
+                if cached is None:
+                    h = FormalityGraph(num_ground_vertices, num_aerial_vertices, edges_sorted)
+                    h_key, h_coeff = self.graph_to_key(h)
+                    if h_key is None:
+                        # not in basis
+                        cached = (None, 1) # NOTE: Here we assume the list of graphs in the basis is enough to make the relation well-defined
+                    else:
+                        # normal form:
+                        h_normal = self.key_to_graph(h_key)
+                        # sign according to number of edges incident to redirect_to:
+                        h_coeff *= -1 if h_normal[0].in_degrees()[redirect_to] % 2 == 1 else 1
+                        cached = (h_key[self.grading_size], h_coeff)
+                    redirect_cache[fingerprint] = cached
+                h_idx, h_coeff = cached
+                if h_idx is None:
                     continue
-                h_key, h_coeff = self.graph_to_key(h)
-                # not in basis:
-                if h_key is None:
-                    continue # NOTE: Here we assume the list of graphs in the basis is enough to make the relation well-defined
-                # normal form:
-                h_normal = self.key_to_graph(h_key)
-                h_idx = h_key[self.grading_size]
-                # sign according to number of edges incident to redirect_to:
-                h_coeff *= -1 if h_normal[0].in_degrees()[redirect_to] % 2 == 1 else 1
-                C[i, h_idx] += h_coeff
-        return C
+                entries[i, h_idx] = entries.get((i, h_idx), 0) + perm_sign * h_coeff
+        return matrix(QQ, len(formality_graphs), len(formality_graphs), entries, sparse=True)
 
     def eye_on_ground_weight_relations(self, num_ground_vertices, num_aerial_vertices):
         """
@@ -363,31 +424,55 @@ class QuantizationGraphBasis(GraphBasis):
         num_graphs = len(formality_graphs)
         from sage.rings.rational_field import QQ
         from sage.matrix.constructor import matrix
-        L = matrix(QQ, num_graphs, num_graphs, sparse=True)
-        eqn_idx = 0
-        for g_idx, g in enumerate(formality_graphs):
-            if g.has_eye_on_ground():
-                L[eqn_idx, g_idx] = 1
-                eqn_idx += 1
-        return L.delete_rows(range(eqn_idx, num_graphs), check=False)
+        eye_indices = [g_idx for g_idx, g in enumerate(formality_graphs) if g.has_eye_on_ground()]
+        entries = {(eqn_idx, g_idx) : 1 for eqn_idx, g_idx in enumerate(eye_indices)}
+        return matrix(QQ, len(eye_indices), num_graphs, entries, sparse=True)
 
-    def multiplication_table(self, num_ground_vertices, num_aerial_vertices1, num_aerial_vertices2):
+    def multiplication_table(self, num_ground_vertices, num_aerial_vertices1, num_aerial_vertices2, max_workers=1):
         """
         Returns a generator representing the bi-linear map of multiplication (i.e. disjoint union of graphs followed by identification of ground vertices) with respect to this basis, restricted to the given gradings.
 
         The generator produces quadruples ``(g_idx, h_idx, plusminus_gh_idx, plusminus)`` such that the product of the graphs identified by ``g_idx`` and ``h_idx`` equals ``plusminus`` times the graph identified by ``plusminus_gh_idx``.
 
+        INPUT:
+
+        - ``max_workers`` -- (default: 1) the number of worker processes to use, or ``None`` to use ``os.cpu_count()``
+
         ASSUMPTIONS:
 
         Assumes that the basis is such that the product of graphs in the basis is also in the span of the basis.
         """
-        for g_idx, g in enumerate(self.graphs(num_ground_vertices, num_aerial_vertices1)):
-            for h_idx, h in enumerate(self.graphs(num_ground_vertices, num_aerial_vertices2)):
-                gh = g.aerial_product(h)
-                gh_key, gh_coeff = self.graph_to_key(gh)
-                assert gh_key is not None
-                gh_idx = gh_key[self.grading_size]
-                yield (g_idx, h_idx, gh_idx, gh_coeff)
+        if max_workers == 1:
+            hs = self.graphs(num_ground_vertices, num_aerial_vertices2)
+            for g_idx, g in enumerate(self.graphs(num_ground_vertices, num_aerial_vertices1)):
+                for h_idx, h in enumerate(hs):
+                    gh = g.aerial_product(h)
+                    gh_key, gh_coeff = self.graph_to_key(gh)
+                    assert gh_key is not None
+                    gh_idx = gh_key[self.grading_size]
+                    yield (g_idx, h_idx, gh_idx, gh_coeff)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            num_g = self.cardinality(num_ground_vertices, num_aerial_vertices1)
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(multiplication_table_row, self, num_ground_vertices, num_aerial_vertices1, num_aerial_vertices2, g_idx) for g_idx in range(num_g)]
+                for future in futures:
+                    yield from future.result()
+
+def multiplication_table_row(basis, num_ground_vertices, num_aerial_vertices1, num_aerial_vertices2, g_idx):
+    """
+    Return the list of multiplication table quadruples for the graph with index ``g_idx``.
+
+    Helper for :meth:`QuantizationGraphBasis.multiplication_table`, at module level so it can be used with multiprocessing.
+    """
+    g = basis.graphs(num_ground_vertices, num_aerial_vertices1)[g_idx]
+    result = []
+    for h_idx, h in enumerate(basis.graphs(num_ground_vertices, num_aerial_vertices2)):
+        gh = g.aerial_product(h)
+        gh_key, gh_coeff = basis.graph_to_key(gh)
+        assert gh_key is not None
+        result.append((g_idx, h_idx, gh_key[basis.grading_size], gh_coeff))
+    return result
 
 def kontsevich_graphs(key, positive_differential_order=None, connected=None, loops=None, mod_ground_permutations=False, max_aerial_in_degree=None, has_odd_automorphism=None):
     num_ground_vertices, num_aerial_vertices = key
@@ -410,6 +495,8 @@ class KontsevichGraphBasis(QuantizationGraphBasis):
         self._mod_ground_permutations = mod_ground_permutations
         self._max_aerial_in_degree = max_aerial_in_degree
         self._graphs = keydefaultdict(partial(kontsevich_graphs, positive_differential_order=positive_differential_order, connected=connected, loops=loops, mod_ground_permutations=mod_ground_permutations, max_aerial_in_degree=max_aerial_in_degree, has_odd_automorphism=False))
+        self._graph_index = keydefaultdict(partial(graph_index, self._graphs))
+        self._key_cache = {}
 
     def flipping_weight_relations(self, num_ground_vertices, num_aerial_vertices):
         """
@@ -428,26 +515,27 @@ class KontsevichGraphBasis(QuantizationGraphBasis):
         from sage.matrix.constructor import matrix
         num_graphs = len(formality_graphs)
         F = matrix(QQ, num_graphs, num_graphs, sparse=True)
-        seen = set()
+        graph_to_idx = {g : g_idx for g_idx, g in enumerate(formality_graphs)}
+        seen = bytearray(num_graphs)
         eqn_idx = 0
         for g_idx, g in enumerate(formality_graphs):
-            if g_idx in seen:
+            if seen[g_idx]:
                 continue
             g_flipped = g.ground_relabeled([1, 0])
             rhs_key, rhs_coeff = self.graph_to_key(g_flipped)
             assert rhs_key is not None
             rhs_normal = self.key_to_graph(rhs_key)
             assert rhs_normal[1] == 1
-            rhs_idx = formality_graphs.index(rhs_normal[0])
-            if rhs_idx in seen:
+            rhs_idx = graph_to_idx[rhs_normal[0]]
+            if seen[rhs_idx]:
                 continue
             rhs_coeff *= flip_sign
             if rhs_idx == g_idx and rhs_coeff == 1:
                 continue
             F[eqn_idx, g_idx] = 1
             F[eqn_idx, rhs_idx] -= rhs_coeff
-            seen.add(g_idx)
-            seen.add(rhs_idx)
+            seen[g_idx] = 1
+            seen[rhs_idx] = 1
             eqn_idx += 1
         return F.delete_rows(range(eqn_idx, num_graphs), check=False)
 
@@ -473,3 +561,5 @@ class LeibnizGraphBasis(QuantizationGraphBasis):
         self._mod_ground_permutations = mod_ground_permutations
         self._max_aerial_in_degree = max_aerial_in_degree
         self._graphs = keydefaultdict(partial(leibniz_graphs, positive_differential_order=positive_differential_order, connected=connected, loops=loops, mod_ground_permutations=mod_ground_permutations, max_aerial_in_degree=max_aerial_in_degree, has_odd_automorphism=False))
+        self._graph_index = keydefaultdict(partial(graph_index, self._graphs))
+        self._key_cache = {}
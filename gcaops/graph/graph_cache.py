@@ -10,6 +10,15 @@ from .graph_file import UndirectedGraphFileView, DirectedGraphFileView, Undirect
 
 GCAOPS_DATA_DIR = os.environ.get('GCAOPS_DATA_DIR')
 
+_data_dir_ready = False
+
+def _ensure_data_dir():
+    # create the data directory on first use; one syscall per process instead of one per cache miss
+    global _data_dir_ready
+    if not _data_dir_ready:
+        os.makedirs(GCAOPS_DATA_DIR, exist_ok=True)
+        _data_dir_ready = True
+
 # TODO: Reuse graphs to save memory.
 
 def options_to_filename(vertices, edges, directed=False, connected=False, biconnected=False, min_degree=0, loops=None, has_odd_automorphism=None):
@@ -85,11 +94,24 @@ class UndirectedGraphCache(GraphCache):
     cache_keys = ['connected', 'biconnected', 'min_degree', 'has_odd_automorphism']
     file_view = UndirectedGraphFileView
 
+    def __init__(self):
+        """
+        Initialize this undirected graph cache.
+        """
+        self._canonicalize_cache = {}
+
     def canonicalize_graph(self, graph):
         """
         Return a tuple consisting the normal form of the graph and the sign factor relating the input graph to the normal form.
+
+        The result is cached, keyed by the number of vertices and the edge tuple of the input graph.
         """
-        return undirected_graph_canonicalize(graph)
+        key = (len(graph), tuple(graph.edges()))
+        result = self._canonicalize_cache.get(key)
+        if result is None:
+            result = undirected_graph_canonicalize(graph)
+            self._canonicalize_cache[key] = result
+        return result
 
     def _add_graphs(self, result, bi_grading, **options):
         if len(result) != 0:
@@ -97,8 +119,7 @@ class UndirectedGraphCache(GraphCache):
 
         num_vertices, num_edges = bi_grading
         del options['directed']
-        for g in undirected_graph_generate(num_vertices, num_edges, **options):
-            result.append(g)
+        result.extend(undirected_graph_generate(num_vertices, num_edges, **options))
 
     def graphs(self, bi_grading, connected=False, biconnected=False, min_degree=0, has_odd_automorphism=True):
         """
@@ -110,8 +131,7 @@ class UndirectedGraphCache(GraphCache):
         if cache_key in self.cache:
             return self.cache[cache_key]
         if GCAOPS_DATA_DIR is not None:
-            if not os.path.isdir(GCAOPS_DATA_DIR):
-                os.makedirs(GCAOPS_DATA_DIR)
+            _ensure_data_dir()
             filename = os.path.join(GCAOPS_DATA_DIR, options_to_filename(num_vertices, num_edges, **options))
             my_graphs = self.file_view(filename, num_vertices, num_edges)
         else:
@@ -139,12 +159,21 @@ class DirectedGraphCache(GraphCache):
         """
         self._undirected_graph_cache = undirected_graph_cache
         self._undirected_to_directed = {}
+        self._undirected_to_directed_index = {}
+        self._canonicalize_cache = {}
 
     def canonicalize_graph(self, graph):
         """
         Return a tuple consisting the normal form of the graph and the sign factor relating the input graph to the normal form.
+
+        The result is cached, keyed by the number of vertices and the edge tuple of the input graph.
         """
-        return directed_graph_canonicalize(graph)
+        key = (len(graph), tuple(graph.edges()))
+        result = self._canonicalize_cache.get(key)
+        if result is None:
+            result = directed_graph_canonicalize(graph)
+            self._canonicalize_cache[key] = result
+        return result
 
     def _add_graphs(self, result, orientation_data, bi_grading, **options):
         if len(result) != 0:
@@ -164,18 +193,18 @@ class DirectedGraphCache(GraphCache):
         else:
             max_loop_order = 0
 
+        # index of the undirected graphs (for orientation data); the number of
+        # vertices is fixed, so the edge tuple determines the graph
+        undirected_graph_index = {tuple(g.edges()) : g_idx for g_idx, g in enumerate(self._undirected_graph_cache.graphs((num_vertices, num_edges), **undirected_options))}
+
         for loop_order in range(max_loop_order + 1):
             loopless = loop_order == 0
             h_idx = 0
             # TODO: use iterator over encodings?
             for g in self._undirected_graph_cache.graphs((num_vertices, num_edges - loop_order), **underlying_undirected_options):
-                # TODO: arrange to get the index of the undirected graph (for orientation data) more efficiently
-                try:
-                    if loopless: # NOTE: only graphs without loops are in the image of the orientation map
-                        g_idx = self._undirected_graph_cache.graphs((num_vertices, num_edges), **undirected_options).index(g)
-                    else:
-                        g_idx = None
-                except ValueError:
+                if loopless: # NOTE: only graphs without loops are in the image of the orientation map
+                    g_idx = undirected_graph_index.get(tuple(g.edges()))
+                else:
                     g_idx = None
                 for h in directed_graph_generate_from_undirected(g, num_edges, loops=options['loops'], has_odd_automorphism=options['has_odd_automorphism']):
                     result.append(h)
@@ -194,8 +223,7 @@ class DirectedGraphCache(GraphCache):
         if cache_key in self.cache:
             return self.cache[cache_key]
         if GCAOPS_DATA_DIR is not None:
-            if not os.path.isdir(GCAOPS_DATA_DIR):
-                os.makedirs(GCAOPS_DATA_DIR)
+            _ensure_data_dir()
             basename = options_to_filename(num_vertices, num_edges, **options)
             filename = os.path.join(GCAOPS_DATA_DIR, basename)
             orientation_filename = os.path.join(GCAOPS_DATA_DIR, 'u_to_' + basename)
@@ -220,9 +248,14 @@ class DirectedGraphCache(GraphCache):
         if GCAOPS_DATA_DIR is not None:
             yield from orientation_data.undirected_to_directed_coeffs(undirected_graph_idx)
         else:
-            for row in orientation_data:
-                if row[0] == undirected_graph_idx:
-                    yield (row[1], row[2])
+            # group the rows by undirected graph index once, instead of scanning the whole list per query
+            index = self._undirected_to_directed_index.get(cache_key)
+            if index is None:
+                index = {}
+                for row in orientation_data:
+                    index.setdefault(row[0], []).append((row[1], row[2]))
+                self._undirected_to_directed_index[cache_key] = index
+            yield from index.get(undirected_graph_idx, [])
 
 class FormalityGraphCache(GraphCache):
     """
@@ -231,19 +264,31 @@ class FormalityGraphCache(GraphCache):
     cache_keys = ['connected', 'max_out_degree', 'num_verts_of_max_out_degree', 'sorted_out_degrees', 'max_aerial_in_degree', 'loops', 'prime', 'has_odd_automorphism', 'positive_differential_order', 'mod_ground_permutations']
     file_view = FormalityGraphFileView
 
+    def __init__(self):
+        """
+        Initialize this formality graph cache.
+        """
+        self._canonicalize_cache = {}
+
     def canonicalize_graph(self, graph):
         """
         Return a tuple consisting the normal form of the graph, an isomorphism from the normal form to the input graph, and the sign of the induced permutation on edges.
+
+        The result is cached, keyed by the vertex counts and the edge tuple of the input graph.
         """
-        return formality_graph_canonicalize(graph)
+        key = (graph.num_ground_vertices(), graph.num_aerial_vertices(), tuple(graph.edges()))
+        result = self._canonicalize_cache.get(key)
+        if result is None:
+            result = formality_graph_canonicalize(graph)
+            self._canonicalize_cache[key] = result
+        return result
 
     def _add_graphs(self, result, tri_grading, **options):
         if len(result) != 0:
             return # assume we've already done this (valid assumption because commit is done *only after* adding *all* the graphs)
 
         num_ground_vertices, num_aerial_vertices, num_edges = tri_grading
-        for g in formality_graph_generate(num_ground_vertices, num_aerial_vertices, num_edges, **options):
-            result.append(g)
+        result.extend(formality_graph_generate(num_ground_vertices, num_aerial_vertices, num_edges, **options))
 
     def graphs(self, tri_grading, connected=None, max_out_degree=None, num_verts_of_max_out_degree=None, sorted_out_degrees=None, max_aerial_in_degree=None,
                loops=None, prime=None, has_odd_automorphism=None, positive_differential_order=None, mod_ground_permutations=False):
@@ -259,8 +304,7 @@ class FormalityGraphCache(GraphCache):
         if cache_key in self.cache:
             return self.cache[cache_key]
         if GCAOPS_DATA_DIR is not None:
-            if not os.path.isdir(GCAOPS_DATA_DIR):
-                os.makedirs(GCAOPS_DATA_DIR)
+            _ensure_data_dir()
             filename = os.path.join(GCAOPS_DATA_DIR, formality_options_to_filename(num_ground_vertices, num_aerial_vertices, num_edges, **options))
             my_graphs = self.file_view(filename, num_ground_vertices, num_aerial_vertices, num_edges)
         else:
@@ -101,6 +101,13 @@ class GraphFileView(ABC):
         cur = self._con.cursor()
         cur.execute('INSERT INTO graphs (graph) VALUES (?)', (self._graph_to_encoding(g),))
 
+    def extend(self, graphs):
+        """
+        Insert the given graphs into this database file.
+        """
+        cur = self._con.cursor()
+        cur.executemany('INSERT INTO graphs (graph) VALUES (?)', ((self._graph_to_encoding(g),) for g in graphs))
+
     def commit(self):
         """
         Commit any changes to this database file.
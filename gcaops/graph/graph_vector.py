@@ -7,6 +7,8 @@ class GraphVector(ABC):
     """
     Vector representing a linear combination of graphs.
     """
+    __slots__ = ()
+
     @abstractmethod
     def __repr__(self):
         """
@@ -188,6 +190,8 @@ class GraphModule(ABC):
     """
     Module spanned by graphs.
     """
+    __slots__ = ()
+
     @abstractmethod
     def base_ring(self):
         """
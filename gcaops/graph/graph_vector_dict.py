@@ -13,6 +13,8 @@ class GraphVector_dict(GraphVector):
     """
     Vector representing a linear combination of graphs (stored as a dictionary).
     """
+    __slots__ = ('_parent', '_vector')
+
     def __init__(self, parent, vector):
         """
         Initialize this graph vector.
@@ -26,18 +28,26 @@ class GraphVector_dict(GraphVector):
         assert isinstance(parent, GraphModule_dict)
         self._parent = parent
         self._vector = defaultdict(partial(zero_in_base_ring, self._parent))
-        for key in vector:
-            self._vector[key] = vector[key]
+        self._vector.update(vector)
+
+    def _compact(self):
+        """
+        Remove the coefficients equal to zero from the backing dictionary.
+
+        Zeros accumulate during long sums; pruning them lazily keeps the
+        additions cheap while bounding the size of the backing dictionary.
+        """
+        zero_keys = [k for k, v in self._vector.items() if v.is_zero()]
+        for k in zero_keys:
+            del self._vector[k]
 
     def __repr__(self):
         """
         Return a string representation of this graph vector.
         """
+        self._compact()
         terms = []
-        for key in self._vector:
-            c = self._vector[key]
-            if c.is_zero():
-                continue
+        for key, c in self._vector.items():
             g, sign = self._parent._graph_basis.key_to_graph(key)
             c *= sign
             c_str = repr(c)
@@ -65,10 +75,8 @@ class GraphVector_dict(GraphVector):
         """
         Facilitates iterating over this graph vector, yielding tuples of the form ``(coeff, graph)``.
         """
-        for key in self._vector:
-            c = self._vector[key]
-            if c.is_zero():
-                continue
+        self._compact()
+        for key, c in list(self._vector.items()):
             g, sign = self._parent._graph_basis.key_to_graph(key)
             c *= sign
             yield (c, g)
@@ -77,11 +85,8 @@ class GraphVector_dict(GraphVector):
         """
         Return the number of graphs with nonzero coefficients in this graph vector.
         """
-        count = 0
-        for c in self._vector.values():
-            if not c.is_zero():
-                count += 1
-        return count
+        self._compact()
+        return len(self._vector)
 
     __pos__ = copy
 
@@ -149,17 +154,30 @@ class GraphVector_dict(GraphVector):
         """
         Return ``True`` if this graph vector is equal to ``other`` and ``False`` otherwise.
         """
-        difference = self - other
-        for k in difference._vector:
-            if not difference._vector[k].is_zero():
-                return False
-        return True
+        if isinstance(other, self.__class__):
+            for k in self._vector.keys() | other._vector.keys():
+                c1 = self._vector.get(k)
+                c2 = other._vector.get(k)
+                if c1 is None:
+                    if not c2.is_zero():
+                        return False
+                elif c2 is None:
+                    if not c1.is_zero():
+                        return False
+                elif not (c1 - c2).is_zero():
+                    return False
+            return True
+        elif other == 0:
+            return all(c.is_zero() for c in self._vector.values())
+        else:
+            return NotImplemented
 
     def gradings(self):
         """
         Return the set of grading tuples such that this graph vector contains terms with those gradings.
         """
         grading_size = self._parent.basis().grading_size
+        self._compact()
         return set(key[:grading_size] for key in self._vector)
 
     def homogeneous_part(self, *grading):
@@ -192,22 +210,27 @@ class GraphVector_dict(GraphVector):
         Return the insertion of ``other`` into this graph vector at the vertex ``position``.
         """
         # TODO: cache when self and other are in normal form. when not, use symmetric group action + operad axioms to deduce result.
+        key_to_graph = self._parent._graph_basis.key_to_graph
+        other_key_to_graph = other._parent._graph_basis.key_to_graph
+        victims = []
+        for victim_key, victim_coeff in other._vector.items():
+            if victim_coeff.is_zero():
+                continue
+            victim, victim_sign = other_key_to_graph(victim_key)
+            if victim_sign != 1:
+                victim_coeff = victim_coeff * victim_sign
+            victims.append((victim, victim_coeff))
         terms = []
-        for user_key in self._vector:
-            user_coeff = self._vector[user_key]
+        for user_key, user_coeff in self._vector.items():
             if user_coeff.is_zero():
                 continue
-            for victim_key in other._vector:
-                victim_coeff = other._vector[victim_key]
-                if victim_coeff.is_zero():
-                    continue
+            user, user_sign = key_to_graph(user_key)
+            if user_sign != 1:
+                user_coeff = user_coeff * user_sign
+            for victim, victim_coeff in victims:
                 product_coeff = user_coeff * victim_coeff
                 if product_coeff.is_zero():
                     continue
-                user, user_sign = self._parent._graph_basis.key_to_graph(user_key)
-                user_coeff *= user_sign
-                victim, victim_sign = other._parent._graph_basis.key_to_graph(victim_key)
-                victim_coeff *= victim_sign
                 for g in user._insertion_graphs(position, victim, **kwargs):
                     terms.append([product_coeff, g])
         return self._parent(terms)
@@ -216,6 +239,8 @@ class GraphModule_dict(GraphModule):
     """
     Module spanned by graphs (with elements stored as dictionaries).
     """
+    __slots__ = ('_base_ring', '_graph_basis', 'element_class')
+
     def __init__(self, base_ring, graph_basis):
         """
         Initialize this graph module.
@@ -268,12 +293,16 @@ class GraphModule_dict(GraphModule):
                 return self.zero()
         elif isinstance(arg, list):
             v = self.zero()
-            for term in arg:
-                coeff, graph = term
-                key, sign = self._graph_basis.graph_to_key(graph)
-                coeff *= sign
-                if key is not None:
-                    v._vector[key] += self._base_ring(coeff)
+            vector = v._vector
+            base_ring = self._base_ring
+            graph_to_key = self._graph_basis.graph_to_key
+            for coeff, graph in arg:
+                key, sign = graph_to_key(graph)
+                if key is None:
+                    continue
+                if sign != 1:
+                    coeff = coeff * sign
+                vector[key] += base_ring(coeff)
             return v
         elif isinstance(arg, self.element_class) and arg.parent() is self:
             return arg
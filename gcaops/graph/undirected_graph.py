@@ -3,12 +3,14 @@ Undirected graph
 """
 from collections.abc import MutableSequence
 from itertools import product
-from gcaops.util.permutation import selection_sort
+from gcaops.util.permutation import sort_with_sign
 
 class UndirectedGraph:
     """
     Undirected graph with vertices labeled by natural numbers and an ordered set of edges.
     """
+    __slots__ = ('_num_vertices', '_edges', '_vertex_positions')
+
     def __init__(self, num_vertices, edges):
         """
         Initialize this undirected graph.
@@ -38,8 +40,7 @@ class UndirectedGraph:
             raise ValueError('Format of edges {} not recognized'.format(edges))
         self._edges = edges
         # canonicalize representation of individual edges
-        for k in range(len(self._edges)):
-            first, last = self._edges[k]
+        for k, (first, last) in enumerate(self._edges):
             if first >= num_vertices or last >= num_vertices:
                 raise ValueError('Vertex labels must be between 0 and the number of vertices')
             if first > last:
@@ -88,6 +89,22 @@ class UndirectedGraph:
         """
         return isinstance(other, self.__class__) and self._num_vertices == other._num_vertices and self._edges == other._edges
 
+    def __hash__(self):
+        """
+        Return a hash of this graph, computed from the number of vertices and the ordered list of edges (consistently with :meth:`__eq__`).
+
+        .. NOTE::
+
+            Graphs are mutable (e.g. by :meth:`canonicalize_edges`), so a graph must not be mutated while it is in use as a dictionary key.
+
+        EXAMPLES::
+
+            sage: g = UndirectedGraph(2, [(0, 1)])
+            sage: hash(g) == hash(UndirectedGraph(2, [(0, 1)]))
+            True
+        """
+        return hash((self._num_vertices, tuple(self._edges)))
+
     def edges(self):
         """
         Return the list of edges of this graph.
@@ -112,7 +129,7 @@ class UndirectedGraph:
             sage: g
             UndirectedGraph(3, [(0, 1), (1, 2)])
         """
-        return selection_sort(self._edges)
+        return sort_with_sign(self._edges)
 
     def relabeled(self, relabeling):
         """
@@ -7,6 +7,12 @@ from .undirected_graph import UndirectedGraph
 from .graph_basis import GraphBasis
 from .graph_cache import undirected_graph_cache
 
+def graph_index(graphs_dict, key):
+    """
+    Return a dictionary mapping the edge tuple of each graph in ``graphs_dict[key]`` to its index in the list.
+    """
+    return {tuple(g.edges()) : index for index, g in enumerate(graphs_dict[key])}
+
 class UndirectedGraphBasis(GraphBasis):
     """
     Basis of a module spanned by undirected graphs.
@@ -30,6 +36,8 @@ class UndirectedGraphComplexBasis(UndirectedGraphBasis):
         self._biconnected = biconnected
         self._min_degree = min_degree
         self._graphs = keydefaultdict(partial(undirected_graph_cache.graphs, connected=connected, biconnected=biconnected, min_degree=min_degree, has_odd_automorphism=False))
+        self._graph_index = keydefaultdict(partial(graph_index, self._graphs))
+        self._cardinalities = {}
 
     def graph_to_key(self, graph):
         """
@@ -45,11 +53,10 @@ class UndirectedGraphComplexBasis(UndirectedGraphBasis):
         """
         g, _, sign = undirected_graph_cache.canonicalize_graph(graph)
         v, e = len(g), len(g.edges())
-        try:
-            index = self._graphs[v,e].index(g)
-            return (v,e,index), sign
-        except ValueError:
+        index = self._graph_index[v,e].get(tuple(g.edges()))
+        if index is None:
             return None, 1
+        return (v,e,index), sign
 
     def key_to_graph(self, key):
         """
@@ -102,7 +109,11 @@ class UndirectedGraphComplexBasis(UndirectedGraphBasis):
         """
         Return the number of graphs in this basis with the given amount of ``vertices`` and ``edges``.
         """
-        return len(self._graphs[vertices,edges])
+        count = self._cardinalities.get((vertices, edges))
+        if count is None:
+            count = len(self._graphs[vertices,edges])
+            self._cardinalities[vertices, edges] = count
+        return count
 
 class UndirectedGraphOperadBasis(UndirectedGraphBasis):
     """
@@ -113,6 +124,7 @@ class UndirectedGraphOperadBasis(UndirectedGraphBasis):
         Initialize this basis.
         """
         self._graphs = keydefaultdict(partial(undirected_graph_cache.graphs, has_odd_automorphism=False))
+        self._graph_index = keydefaultdict(partial(graph_index, self._graphs))
 
     def graph_to_key(self, graph):
         """
@@ -128,11 +140,10 @@ class UndirectedGraphOperadBasis(UndirectedGraphBasis):
         """
         g, undo_canonicalize, sign = undirected_graph_cache.canonicalize_graph(graph)
         v, e = len(g), len(g.edges())
-        try:
-            index = self._graphs[v,e].index(g)
-            return (v,e,index) + tuple(undo_canonicalize), sign
-        except ValueError:
+        index = self._graph_index[v,e].get(tuple(g.edges()))
+        if index is None:
             return None, 1
+        return (v,e,index) + tuple(undo_canonicalize), sign
 
     def key_to_graph(self, key):
         """
@@ -1,3 +1,4 @@
+import io
 import itertools
 import subprocess
 import os
@@ -5,7 +6,11 @@ import sage.all # make SageMath work when called from Python
 from sage.env import SAGE_NAUTY_BINS_PREFIX
 from sage.graphs.digraph import DiGraph
 from gcaops.graph.formality_graph import FormalityGraph
-from .permutation import selection_sort
+from .permutation import sort_with_sign
+
+def _vertex_partition(num_ground_vertices, num_aerial_vertices):
+    # ground vertices are fixed pointwise; aerial vertices may be permuted
+    return [[v] for v in range(num_ground_vertices)] + [list(range(num_ground_vertices, num_ground_vertices + num_aerial_vertices))]
 
 def nauty_generate_formality(num_ground_vertices, num_aerial_vertices, num_undirected_edges, num_directed_edges,
         connected=None, max_out_degree=None, num_verts_of_max_out_degree=None, loops=None):
@@ -27,8 +32,8 @@ def nauty_generate_formality(num_ground_vertices, num_aerial_vertices, num_undir
     geng = subprocess.Popen((SAGE_NAUTY_BINS_PREFIX + 'geng', *geng_args), stdout=subprocess.PIPE, stderr=FNULL)
     directg = subprocess.Popen((SAGE_NAUTY_BINS_PREFIX + 'directg', *directg_args), stdin=geng.stdout, stdout=subprocess.PIPE, stderr=FNULL)
     pickg = subprocess.Popen((SAGE_NAUTY_BINS_PREFIX + 'pickg', *pickg_args), stdin=directg.stdout, stdout=subprocess.PIPE, stderr=FNULL)
-    for line in pickg.stdout:
-        digraph6_string = line.decode('ascii').rstrip()
+    for line in io.TextIOWrapper(pickg.stdout, encoding='ascii'):
+        digraph6_string = line.rstrip()
         yield DiGraph(digraph6_string[1:])
 
 def formality_graph_generate(num_ground_vertices, num_aerial_vertices, num_edges,
@@ -41,7 +46,7 @@ def formality_graph_generate(num_ground_vertices, num_aerial_vertices, num_edges
     else:
         max_loop_order = 0
     num_vertices = num_ground_vertices + num_aerial_vertices
-    partition = [[v] for v in range(num_ground_vertices)] + [list(range(num_ground_vertices, num_vertices))]
+    partition = _vertex_partition(num_ground_vertices, num_aerial_vertices)
     for loop_order in range(max_loop_order + 1):
         for h in nauty_generate_formality(num_ground_vertices, num_aerial_vertices, num_edges - loop_order, num_edges,
                                           connected=connected, max_out_degree=max_out_degree,
@@ -49,29 +54,40 @@ def formality_graph_generate(num_ground_vertices, num_aerial_vertices, num_edges
             if sorted_out_degrees is not None and tuple(sorted(h.out_degree_sequence())) != sorted_out_degrees:
                 continue
             # Choose sinks
-            possible_sinks = [v for v in h if h.out_degree(v) == 0]
+            vertices = list(h)
+            h_edges = list(h.edges(labels=False, sort=False))
+            in_degree = {v : h.in_degree(v) for v in vertices}
+            possible_sinks = [v for v in vertices if h.out_degree(v) == 0]
             # TODO: instead of all combinations, mod out by automorphisms
-            seen = []
+            seen = set()
+            seen_relabeled = set()
             for sinks in itertools.combinations(possible_sinks, num_ground_vertices):
-                non_sinks = tuple(v for v in h if not v in sinks)
-                if max_aerial_in_degree is not None and max(h.in_degree(v) for v in non_sinks) > max_aerial_in_degree:
+                sinks_set = set(sinks)
+                non_sinks = tuple(v for v in vertices if not v in sinks_set)
+                if max_aerial_in_degree is not None and max(in_degree[v] for v in non_sinks) > max_aerial_in_degree:
                     continue
-                # Relabel sinks to 0, 1, ...
+                # Relabel sinks to sigma(0), sigma(1), ... in a single relabeling
                 relabeling = dict(zip(sinks + non_sinks, range(num_vertices)))
-                k = h.relabel(relabeling, inplace=False)
                 if mod_ground_permutations:
                     ground_permutations = [list(range(num_ground_vertices))]
                 else:
                     ground_permutations = itertools.permutations(range(num_ground_vertices))
                 for sigma in ground_permutations:
-                    hh = k.relabel(dict(zip(range(num_ground_vertices), sigma)), inplace=False)
+                    combined = {v : sigma[w] if w < num_ground_vertices else w for v, w in relabeling.items()}
+                    # relabelings with the same edge multiset lead to the same canonical form
+                    relabeled_edges = tuple(sorted((combined[a], combined[b]) for (a, b) in h_edges))
+                    if relabeled_edges in seen_relabeled:
+                        continue
+                    seen_relabeled.add(relabeled_edges)
+                    hh = h.relabel(combined, inplace=False)
                     hh = hh.canonical_label(partition=partition)
-                    g = FormalityGraph(num_ground_vertices, num_aerial_vertices, list(hh.edges(labels=False, sort=True)))
-                    g.canonicalize_edges()
-                    if g in seen:
+                    g = FormalityGraph(num_ground_vertices, num_aerial_vertices, list(hh.edges(labels=False, sort=False)))
+                    g.canonicalize_edges() # sorts the edges
+                    seen_key = tuple(g.edges())
+                    if seen_key in seen:
                         continue
                     else:
-                        seen.append(g)
+                        seen.add(seen_key)
                     if positive_differential_order is not None and positive_differential_order != (not 0 in g.differential_orders()):
                         continue
                     if has_odd_automorphism is not None and formality_graph_has_odd_automorphism(g) != has_odd_automorphism:
@@ -83,35 +99,59 @@ def formality_graph_generate(num_ground_vertices, num_aerial_vertices, num_edges
 def formality_graph_canonicalize(g):
     n = len(g)
     edges = g.edges()
-    partition = [[v] for v in range(g.num_ground_vertices())] + [list(range(g.num_ground_vertices(), g.num_ground_vertices() + g.num_aerial_vertices()))]
-    H = DiGraph([list(range(n)), edges], loops=True)
-    if len(H.edges()) != len(g.edges()):
+    partition = _vertex_partition(g.num_ground_vertices(), g.num_aerial_vertices())
+    if len(set(edges)) != len(edges):
         raise ValueError("don't know how to canonicalize graph with double edges")
+    H = DiGraph([list(range(n)), edges], loops=True)
     G, sigma = H.canonical_label(partition=partition, certificate=True)
     new_edges = list(G.edges(labels=False, sort=True))
-    edge_permutation = [tuple([sigma[edge[0]],sigma[edge[1]]]) for edge in edges]
-    index_permutation = [new_edges.index(e) for e in edge_permutation]
+    edge_index = {e : i for i, e in enumerate(new_edges)}
+    index_permutation = [edge_index[tuple([sigma[edge[0]],sigma[edge[1]]])] for edge in edges]
     undo_canonicalize = [0]*n
     for k, v in sigma.items():
         undo_canonicalize[v] = k
-    return FormalityGraph(g.num_ground_vertices(), g.num_aerial_vertices(), list(new_edges)), undo_canonicalize, selection_sort(index_permutation)
+    return FormalityGraph(g.num_ground_vertices(), g.num_aerial_vertices(), list(new_edges)), undo_canonicalize, sort_with_sign(index_permutation)
+
+_odd_automorphism_cache = {}
 
 def formality_graph_has_odd_automorphism(g):
+    key = (g.num_ground_vertices(), g.num_aerial_vertices(), tuple(g.edges()))
+    result = _odd_automorphism_cache.get(key)
+    if result is None:
+        result = _formality_graph_has_odd_automorphism(g)
+        _odd_automorphism_cache[key] = result
+    return result
+
+def _formality_graph_has_odd_automorphism(g):
     n = len(g)
     edges = g.edges()
-    partition = [[v] for v in range(g.num_ground_vertices())] + [list(range(g.num_ground_vertices(), g.num_ground_vertices() + g.num_aerial_vertices()))]
+    partition = _vertex_partition(g.num_ground_vertices(), g.num_aerial_vertices())
     G = DiGraph([list(range(n)), edges])
-    for sigma in G.automorphism_group(partition=partition).gens(): # NOTE: it suffices to check generators
-        edge_permutation = [tuple([sigma(edge[0]),sigma(edge[1])]) for edge in edges]
-        index_permutation = [edges.index(e) for e in edge_permutation]
-        if selection_sort(index_permutation) == -1:
+    automorphism_group = G.automorphism_group(partition=partition)
+    if automorphism_group.order() == 1:
+        return False
+    edge_index = {e : i for i, e in enumerate(edges)}
+    for sigma in automorphism_group.gens(): # NOTE: it suffices to check generators
+        index_permutation = [edge_index[(sigma(a), sigma(b))] for (a, b) in edges]
+        if sort_with_sign(index_permutation) == -1:
             return True
     return False
 
+_is_prime_cache = {}
+
 def formality_graph_is_prime(g):
+    key = (g.num_ground_vertices(), g.num_aerial_vertices(), tuple(g.edges()))
+    result = _is_prime_cache.get(key)
+    if result is None:
+        result = _formality_graph_is_prime(g)
+        _is_prime_cache[key] = result
+    return result
+
+def _formality_graph_is_prime(g):
     n = len(g)
-    G = DiGraph([list(range(n)), g.edges()])
-    G.delete_vertices(list(range(g.num_ground_vertices())))
+    num_ground = g.num_ground_vertices()
+    aerial_edges = [(a, b) for (a, b) in g.edges() if a >= num_ground and b >= num_ground]
+    G = DiGraph([list(range(num_ground, n)), aerial_edges])
     return G.is_connected()
 
 def formality_graph_to_encoding(g):
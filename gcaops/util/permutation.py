@@ -1,3 +1,28 @@
+def sort_with_sign(lst):
+    """
+    Sort ``lst`` in place and return the sign of the sorting permutation.
+
+    Equivalent to :func:`selection_sort` for lists of distinct elements, but
+    runs in O(n log n): the permutation comes from a stable sort and its sign
+    from counting cycles.
+    """
+    n = len(lst)
+    perm = sorted(range(n), key=lst.__getitem__)
+    sign = 1
+    visited = [False]*n
+    for i in range(n):
+        if not visited[i]:
+            j = i
+            cycle_length = 0
+            while not visited[j]:
+                visited[j] = True
+                j = perm[j]
+                cycle_length += 1
+            if cycle_length % 2 == 0:
+                sign = -sign
+    lst[:] = [lst[i] for i in perm]
+    return sign
+
 def selection_sort(lst):
     sign = 1
     for i in range(0, len(lst)-1):